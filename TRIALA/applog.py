@@ -0,0 +1,127 @@
+"""Structured JSON logging that keeps file I/O off the calling thread.
+
+Records are put on an in-memory queue by a QueueHandler and written by a
+QueueListener thread to a log file, one JSON object per line.
+Extra fields passed with `extra={...}` become keys of that object, and
+records logged while a request id is set carry it as `request_id`.
+
+Settings come from the environment:
+  TRIALA_LOG_FILE           log file path (default logs/triala.log)
+  TRIALA_LOG_LEVEL          root level (default INFO)
+  TRIALA_ACCESS_LOG_SAMPLE  share of successful requests logged (default 0.1)
+  TRIALA_LOG_ROTATE         'size' (default) rotates the file in-process at
+                            5 MB; 'external' leaves rotation to logrotate
+
+In-process rotation is only safe with a single process writing the file.
+Several gunicorn workers sharing one file must use 'external': each worker
+appends and reopens the file once logrotate has moved it
+(see deploy/logrotate_triala).
+"""
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+from datetime import datetime, timezone
+
+LOG_FILE = os.environ.get('TRIALA_LOG_FILE', os.path.join(os.path.dirname(__file__), 'logs', 'triala.log'))
+LOG_LEVEL = os.environ.get('TRIALA_LOG_LEVEL', 'INFO').upper()
+ACCESS_LOG_SAMPLE = float(os.environ.get('TRIALA_ACCESS_LOG_SAMPLE', '0.1'))
+LOG_ROTATE = os.environ.get('TRIALA_LOG_ROTATE', 'size').lower()
+# rotate at 5 MB, keep 5 old files
+MAX_BYTES = 5 * 1024 * 1024
+BACKUP_COUNT = 5
+
+request_id = contextvars.ContextVar('request_id', default=None)
+
+_STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'request_id'}
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        if getattr(record, 'request_id', None):
+            entry['request_id'] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamp records with the current request id (runs on the calling thread)."""
+
+    def filter(self, record):
+        # keep an id passed explicitly, e.g. by a callback run after the request
+        if not getattr(record, 'request_id', None):
+            record.request_id = request_id.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Pass every WARNING and above, and a `rate` share of lower records."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # resolve the message and traceback now, while args and the stack
+        # are still live; JSON formatting happens on the listener thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _file_handler(log_file, rotate):
+    if rotate == 'external':
+        return logging.handlers.WatchedFileHandler(log_file, encoding='utf-8')
+    if rotate == 'size':
+        return logging.handlers.RotatingFileHandler(log_file, maxBytes=MAX_BYTES, backupCount=BACKUP_COUNT, encoding='utf-8')
+    raise ValueError(f"TRIALA_LOG_ROTATE must be 'size' or 'external', not {rotate!r}")
+
+
+def setup_logging(log_file=LOG_FILE, level=LOG_LEVEL, rotate=LOG_ROTATE):
+    """Route the root logger through the queue; safe to call more than once."""
+    global _listener
+    if _listener is not None:
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+    file_handler = _file_handler(log_file, rotate)
+    file_handler.setFormatter(JsonFormatter())
+    q = queue.SimpleQueue()
+    handler = _QueueHandler(q)
+    handler.addFilter(RequestIdFilter())
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(level)
+    logging.getLogger('triala.access').addFilter(SamplingFilter(ACCESS_LOG_SAMPLE))
+    # the dev server's own per-request lines would bypass the sampled
+    # triala.access records and duplicate them
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    _listener = logging.handlers.QueueListener(q, file_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
@@ -39,6 +39,8 @@ User=www-data
 Group=www-data
 WorkingDirectory=/opt/triala
 Environment=PATH=/opt/triala/venv/bin
+# several workers share logs/triala.log, so logrotate rotates it (deploy/logrotate_triala)
+Environment=TRIALA_LOG_ROTATE=external
 ExecStart=/opt/triala/venv/bin/gunicorn --workers 3 --bind 127.0.0.1:8000 web_app:app
 Restart=always
 RestartSec=5
@@ -50,6 +52,9 @@ EOF
 sudo systemctl daemon-reload
 sudo systemctl enable --now ${SERVICE_NAME}
 
+echo "Installing logrotate config to /etc/logrotate.d/${SERVICE_NAME}"
+sudo install -m 644 deploy/logrotate_triala /etc/logrotate.d/${SERVICE_NAME}
+
 echo "Configuring Nginx..."
 sudo tee /etc/nginx/sites-available/${SERVICE_NAME} > /dev/null <<EOF
 server {
@@ -0,0 +1,126 @@
+"""Group (block) bookings: several rooms checked in and out together.
+
+Each operation runs in a single `BEGIN IMMEDIATE` transaction, so two
+front desks competing for the same rooms cannot both get them.
+"""
+from datetime import date, datetime, timedelta
+import pricing
+
+
+def create_tables(cur):
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS booking_groups (
+        id INTEGER PRIMARY KEY,
+        name TEXT,
+        guest_id INTEGER,
+        created_at TEXT,
+        FOREIGN KEY(guest_id) REFERENCES guests(id)
+    )
+    ''')
+    cur.execute("PRAGMA table_info('bookings')")
+    if 'group_id' not in [r[1] for r in cur.fetchall()]:
+        cur.execute('ALTER TABLE bookings ADD COLUMN group_id INTEGER REFERENCES booking_groups(id)')
+
+
+def check_in_group(conn, guest_id, nights, room_ids=None, room_type=None, count=None, name=None):
+    """Check `guest_id` into `room_ids`, or into any `count` rooms of `room_type`.
+
+    Either every room is booked or none is; raises ValueError if the rooms
+    are not all available, the guest doesn't exist or `nights` is outside
+    1..MAX_QUOTE_NIGHTS. Returns (group_id, booked room ids).
+    """
+    cur = conn.cursor()
+    cur.execute('BEGIN IMMEDIATE')
+    try:
+        nights = int(nights)
+        if not 0 < nights <= pricing.MAX_QUOTE_NIGHTS:
+            raise ValueError(f'nights must be between 1 and {pricing.MAX_QUOTE_NIGHTS}')
+        cur.execute('SELECT id FROM guests WHERE id=?', (guest_id,))
+        if not cur.fetchone():
+            raise ValueError('Guest not found')
+        start = date.today()
+        end = start + timedelta(days=nights)
+        if room_ids:
+            room_ids = list(dict.fromkeys(int(r) for r in room_ids))
+            cur.execute('SELECT id FROM rooms WHERE available=1 AND id IN ({})'.format(','.join('?' * len(room_ids))), room_ids)
+            free = {r[0] for r in cur.fetchall()}
+            taken = [r for r in room_ids if r not in free]
+            if taken:
+                raise ValueError('Rooms not available: ' + ', '.join(str(r) for r in taken))
+        else:
+            if not room_type or not count or int(count) <= 0:
+                raise ValueError('Give room ids or a room type and count')
+            cur.execute('SELECT id FROM rooms WHERE available=1 AND type=? ORDER BY number LIMIT ?', (room_type, int(count)))
+            room_ids = [r[0] for r in cur.fetchall()]
+            if len(room_ids) < int(count):
+                raise ValueError(f'Only {len(room_ids)} {room_type} room(s) available')
+        cur.execute('INSERT INTO booking_groups(name, guest_id, created_at) VALUES (?, ?, ?)',
+                    (name, guest_id, datetime.now().isoformat(timespec='seconds')))
+        group_id = cur.lastrowid
+        cur.executemany('INSERT INTO bookings(guest_id, room_id, start_date, end_date, status, group_id) VALUES (?, ?, ?, ?, ?, ?)',
+                        [(guest_id, r, start.isoformat(), end.isoformat(), 'checked_in', group_id) for r in room_ids])
+        cur.execute('UPDATE rooms SET available=0 WHERE id IN ({})'.format(','.join('?' * len(room_ids))), room_ids)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return group_id, room_ids
+
+
+def get_group(cur, group_id):
+    """Return (id, name, guest name, guest phone, guest NIN) or None."""
+    cur.execute('SELECT bg.id, bg.name, g.name, g.phone, g.nin_number FROM booking_groups bg JOIN guests g ON bg.guest_id=g.id WHERE bg.id=?', (group_id,))
+    return cur.fetchone()
+
+
+def _line(book, booking_id, room_number, room_type, room_price, start, end):
+    q = book.quote(room_type, room_price, start, end)
+    return {
+        'booking_id': booking_id,
+        'room_number': room_number,
+        'start_date': start.isoformat(),
+        'end_date': end.isoformat(),
+        'nights': q['nights'],
+        'subtotal_ugx': q['subtotal_ugx'],
+        'discount_ugx': q['discount_ugx'],
+        'amount_ugx': q['total_ugx'],
+    }
+
+
+def check_out_group(conn, group_id):
+    """Check out every open booking in the group and return its charge lines.
+
+    Raises ValueError if the group does not exist or is already checked out.
+    """
+    cur = conn.cursor()
+    cur.execute('BEGIN IMMEDIATE')
+    try:
+        if not get_group(cur, group_id):
+            raise ValueError('Group not found')
+        cur.execute("SELECT b.id, b.room_id, r.number, r.type, r.price, b.start_date, b.end_date FROM bookings b JOIN rooms r ON b.room_id=r.id WHERE b.group_id=? AND b.status!='checked_out' ORDER BY r.number", (group_id,))
+        rows = cur.fetchall()
+        if not rows:
+            raise ValueError('Already checked out')
+        book = pricing.get_rate_book(cur)
+        today = date.today()
+        lines = []
+        for booking_id, _, number, rtype, price, start_date, end_date in rows:
+            last_day = min(date.fromisoformat(end_date), today)
+            lines.append(_line(book, booking_id, number, rtype, price, date.fromisoformat(start_date), last_day))
+        cur.executemany('UPDATE bookings SET status=?, end_date=? WHERE id=?',
+                        [('checked_out', min(date.fromisoformat(r[6]), today).isoformat(), r[0]) for r in rows])
+        cur.executemany('UPDATE rooms SET available=1 WHERE id=?', [(r[1],) for r in rows])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return lines
+
+
+def invoice_lines(cur, group_id):
+    """Charge lines for every booking in the group, priced over the booked dates."""
+    cur.execute('SELECT b.id, r.number, r.type, r.price, b.start_date, b.end_date FROM bookings b JOIN rooms r ON b.room_id=r.id WHERE b.group_id=? ORDER BY r.number', (group_id,))
+    rows = cur.fetchall()
+    book = pricing.get_rate_book(cur)
+    return [_line(book, booking_id, number, rtype, price, date.fromisoformat(s), date.fromisoformat(e))
+            for booking_id, number, rtype, price, s, e in rows]
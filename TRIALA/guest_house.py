@@ -1,11 +1,22 @@
 import sqlite3
 import argparse
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+import logging
 import os
+import applog
+import groups
+import pricing
+import sync
 
-DB_PATH = os.path.join(os.path.dirname(__file__), 'guesthouse.db')
+# TRIALA_DB points the app at another database (used by the tests)
+DB_PATH = os.environ.get('TRIALA_DB', os.path.join(os.path.dirname(__file__), 'guesthouse.db'))
 # prices stored in DB are UGX
 RATE_USD_TO_UGX = 3700
+# tables whose writes are counted in `table_versions`
+VERSIONED_TABLES = ('rooms', 'guests', 'bookings') + pricing.RATE_TABLES
+
+# terminal output stays on stdout; events are also logged for auditing
+logger = logging.getLogger('triala.cli')
 
 
 def get_conn():
@@ -56,6 +67,26 @@ def init_db():
         FOREIGN KEY(room_id) REFERENCES rooms(id)
     )
     ''')
+    groups.create_tables(cur)
+    pricing.create_tables(cur)
+    sync.create_tables(cur)
+    # per-table change counters bumped by triggers, so any write (web or CLI)
+    # invalidates the web app's cached template fragments
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS table_versions (
+        name TEXT PRIMARY KEY,
+        version INTEGER DEFAULT 0
+    )
+    ''')
+    for table in VERSIONED_TABLES:
+        cur.execute('INSERT OR IGNORE INTO table_versions(name, version) VALUES (?, 0)', (table,))
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            cur.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_version AFTER {event} ON {table}
+            BEGIN
+                UPDATE table_versions SET version = version + 1 WHERE name = '{table}';
+            END
+            ''')
     conn.commit()
     conn.close()
 
@@ -116,7 +147,11 @@ def check_in(guest_id, room_id, nights):
         print('Room not found')
         conn.close()
         return
-    if row[0] == 0:
+    # claim the room only if it is still free, so a concurrent (group)
+    # check-in can't take it between the lookup and the insert
+    cur.execute('UPDATE rooms SET available=0 WHERE id=? AND available=1', (room_id,))
+    if cur.rowcount != 1:
+        conn.rollback()
         print('Room is not available')
         conn.close()
         return
@@ -124,22 +159,73 @@ def check_in(guest_id, room_id, nights):
     end = start + timedelta(days=int(nights))
     cur.execute('INSERT INTO bookings(guest_id, room_id, start_date, end_date, status) VALUES (?, ?, ?, ?, ?)',
                 (guest_id, room_id, start.isoformat(), end.isoformat(), 'checked_in'))
-    cur.execute('UPDATE rooms SET available=0 WHERE id=?', (room_id,))
     conn.commit()
+    logger.info('checked in', extra={'booking_id': cur.lastrowid, 'guest_id': guest_id, 'room_id': room_id, 'nights': int(nights)})
     print(f'Guest {guest_id} checked into room {room_id} until {end.isoformat()}')
     conn.close()
 
 
+def group_check_in(guest_id, nights, room_ids=None, room_type=None, count=None, name=None):
+    conn = get_conn()
+    try:
+        group_id, booked = groups.check_in_group(conn, guest_id, nights, room_ids, room_type, count, name)
+    except ValueError as e:
+        logger.warning('group check-in refused: %s', e, extra={'guest_id': guest_id})
+        print(e)
+        return
+    finally:
+        conn.close()
+    logger.info('group checked in', extra={'group_id': group_id, 'guest_id': guest_id, 'room_ids': booked})
+    print(f'Group {group_id}: guest {guest_id} checked into {len(booked)} room(s): ' + ', '.join(str(r) for r in booked))
+
+
+def group_check_out(group_id):
+    conn = get_conn()
+    try:
+        group = groups.get_group(conn.cursor(), group_id)
+        lines = groups.check_out_group(conn, group_id)
+    except ValueError as e:
+        print(e)
+        return
+    finally:
+        conn.close()
+    total_ugx = sum(line['amount_ugx'] for line in lines)
+    logger.info('group checked out', extra={'group_id': group_id, 'rooms': len(lines), 'amount_ugx': total_ugx})
+    print('----- GROUP RECEIPT -----')
+    print(f'Group ID: {group_id} {group[1] or ""}')
+    print(f'Guest: {group[2]} ({group[3]})')
+    print('{:>5}  {:6}  {:10}  {:6}  {}'.format('Book','Room','Start','Nights','Amount'))
+    for line in lines:
+        print('{:>5}  {:6}  {:10}  {:>6}  UGX {:,}'.format(line['booking_id'], line['room_number'], line['start_date'], line['nights'], line['amount_ugx']))
+    print(f'Total (USD): ${total_ugx / RATE_USD_TO_UGX:.2f}')
+    print(f'Total (UGX): UGX {total_ugx:,}')
+    print('-------------------------')
+
+
+def list_groups():
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("SELECT bg.id, bg.name, g.name, COUNT(b.id), SUM(b.status!='checked_out') FROM booking_groups bg JOIN guests g ON bg.guest_id=g.id LEFT JOIN bookings b ON b.group_id=bg.id GROUP BY bg.id ORDER BY bg.id")
+    rows = cur.fetchall()
+    conn.close()
+    if not rows:
+        print('No groups found.')
+        return
+    print('{:>3}  {:20}  {:15}  {:5}  {}'.format('ID','Name','Guest','Rooms','Open'))
+    for r in rows:
+        print('{:>3}  {:20}  {:15}  {:>5}  {}'.format(r[0], r[1] or '', r[2], r[3], r[4] or 0))
+
+
 def check_out(booking_id):
     conn = get_conn()
     cur = conn.cursor()
-    cur.execute('SELECT b.room_id, b.start_date, b.end_date, b.status, g.name, r.number, r.price, g.phone FROM bookings b JOIN guests g ON b.guest_id=g.id JOIN rooms r ON b.room_id=r.id WHERE b.id=?', (booking_id,))
+    cur.execute('SELECT b.room_id, b.start_date, b.end_date, b.status, g.name, r.number, r.price, g.phone, r.type FROM bookings b JOIN guests g ON b.guest_id=g.id JOIN rooms r ON b.room_id=r.id WHERE b.id=?', (booking_id,))
     row = cur.fetchone()
     if not row:
         print('Booking not found')
         conn.close()
         return
-    room_id, start_date, end_date, status, guest_name, room_number, room_price, guest_phone = row
+    room_id, start_date, end_date, status, guest_name, room_number, room_price, guest_phone, room_type = row
     if status == 'checked_out':
         print('Already checked out')
         conn.close()
@@ -150,17 +236,17 @@ def check_out(booking_id):
     e = date.fromisoformat(end_date)
     today = date.today()
     last_day = min(e, today)
-    nights = (last_day - s).days
-    if nights <= 0:
-        nights = 1
-    # room_price stored in UGX
-    amount_ugx = nights * int(room_price or 0)
+    # room_price stored in UGX; rate plans and discounts are applied on top
+    q = pricing.get_rate_book(cur).quote(room_type, room_price, s, last_day)
+    nights = q['nights']
+    amount_ugx = q['total_ugx']
     amount_usd = (amount_ugx / RATE_USD_TO_UGX) if RATE_USD_TO_UGX else 0.0
 
     # update booking status and room availability
     cur.execute('UPDATE bookings SET status=?, end_date=? WHERE id=?', ('checked_out', last_day.isoformat(), booking_id))
     cur.execute('UPDATE rooms SET available=1 WHERE id=?', (room_id,))
     conn.commit()
+    logger.info('checked out', extra={'booking_id': booking_id, 'nights': nights, 'amount_ugx': amount_ugx})
 
     # print receipt
     print('----- RECEIPT -----')
@@ -170,6 +256,8 @@ def check_out(booking_id):
     print(f'Start: {s.isoformat()}')
     print(f'Checked out: {last_day.isoformat()}')
     print(f'Nights stayed: {nights}')
+    if q['discount_ugx']:
+        print(f"Discount ({q['discount_percent']:g}%): UGX {q['discount_ugx']:,}")
     print(f'Amount (USD): ${amount_usd:.2f}')
     print(f'Amount (UGX): UGX {amount_ugx:,}')
     print('-------------------')
@@ -193,6 +281,81 @@ def list_bookings(show_all=False):
         print('{:>3}  {:15}  {:6}  {:10}  {:10}  {}'.format(b[0], b[1], b[2], b[3], b[4], b[5]))
 
 
+def add_rate_plan(name, room_type=None, start_date=None, end_date=None, nightly_rate=None, weekend_surcharge=None, priority=0):
+    # dates are parsed on every quote, so only well-formed ones are stored
+    start_date = date.fromisoformat(str(start_date)) if start_date else None
+    end_date = date.fromisoformat(str(end_date)) if end_date else None
+    if start_date and end_date and end_date < start_date:
+        print('End date is before start date')
+        return
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute('INSERT INTO rate_plans(name, room_type, start_date, end_date, nightly_rate, weekend_surcharge, priority) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (name, room_type, start_date and start_date.isoformat(), end_date and end_date.isoformat(), nightly_rate, weekend_surcharge, priority))
+    conn.commit()
+    print(f'Rate plan added with id {cur.lastrowid}')
+    conn.close()
+
+
+def add_los_discount(min_nights, percent, room_type=None):
+    if min_nights < 1:
+        print('Minimum nights must be at least 1')
+        return
+    if not 0 <= percent <= 100:
+        print('Discount percent must be between 0 and 100')
+        return
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute('INSERT INTO los_discounts(room_type, min_nights, percent) VALUES (?, ?, ?)', (room_type, min_nights, percent))
+    conn.commit()
+    print(f'Length-of-stay discount added with id {cur.lastrowid}')
+    conn.close()
+
+
+def list_rate_plans():
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute('SELECT id, name, room_type, start_date, end_date, nightly_rate, weekend_surcharge, priority FROM rate_plans ORDER BY priority, id')
+    plans = cur.fetchall()
+    cur.execute('SELECT id, room_type, min_nights, percent FROM los_discounts ORDER BY min_nights')
+    discounts = cur.fetchall()
+    conn.close()
+    if not plans and not discounts:
+        print('No rate plans defined.')
+        return
+    print('{:>3}  {:15}  {:10}  {:10}  {:10}  {:12}  {:8}  {}'.format('ID','Name','Type','From','To','Rate(UGX)','Weekend','Priority'))
+    for p in plans:
+        rate = f'UGX {int(p[5]):,}' if p[5] is not None else '-'
+        weekend = f'+{p[6]:g}%' if p[6] is not None else '-'
+        print('{:>3}  {:15}  {:10}  {:10}  {:10}  {:12}  {:8}  {}'.format(p[0], p[1] or '', p[2] or 'all', p[3] or '-', p[4] or '-', rate, weekend, p[7] or 0))
+    if discounts:
+        print('Length-of-stay discounts:')
+        for d in discounts:
+            print(f' - {d[3]:g}% off {d[2]}+ nights ({d[1] or "all types"})')
+
+
+def quote(room_id, start_date, nights):
+    start = start_date or date.today()
+    conn = get_conn()
+    cur = conn.cursor()
+    try:
+        q = pricing.quote_room(cur, room_id, start, nights)
+    except ValueError as e:
+        print(e)
+        return
+    finally:
+        conn.close()
+    if not q:
+        print('Room not found')
+        return
+    print(f"Room {q['room_number']} ({q['room_type']}): {q['start_date']} to {q['end_date']}, {q['nights']} night(s)")
+    print(f"Subtotal: UGX {q['subtotal_ugx']:,}")
+    if q['discount_ugx']:
+        print(f"Discount ({q['discount_percent']:g}%): UGX {q['discount_ugx']:,}")
+    print(f"Total (UGX): UGX {q['total_ugx']:,}")
+    print(f"Total (USD): ${q['total_ugx'] / RATE_USD_TO_UGX:.2f}")
+
+
 def monthly_report(year: int, month: int):
     """Print a monthly report: number of bookings and unique guests with start_date in the month."""
     from datetime import date
@@ -221,6 +384,13 @@ def monthly_report(year: int, month: int):
         print(f' - {name} (id {gid}): {cnt} booking(s)')
 
 
+def iso_date(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'invalid date {value!r}, expected YYYY-MM-DD')
+
+
 def main():
     parser = argparse.ArgumentParser(description='Guest House Management CLI')
     sub = parser.add_subparsers(dest='cmd')
@@ -249,6 +419,19 @@ def main():
     p = sub.add_parser('check-out')
     p.add_argument('--booking-id', required=True, type=int)
 
+    p = sub.add_parser('group-check-in')
+    p.add_argument('--guest-id', required=True, type=int)
+    p.add_argument('--nights', required=True, type=int)
+    p.add_argument('--name')
+    p.add_argument('--room-ids', type=lambda v: [int(x) for x in v.split(',')], dest='room_ids', help='comma separated room ids')
+    p.add_argument('--type', dest='room_type', help='book any --count rooms of this type')
+    p.add_argument('--count', type=int)
+
+    p = sub.add_parser('group-check-out')
+    p.add_argument('--group-id', required=True, type=int)
+
+    sub.add_parser('list-groups')
+
     p = sub.add_parser('monthly-report')
     p.add_argument('--year', required=True, type=int)
     p.add_argument('--month', required=True, type=int)
@@ -256,9 +439,34 @@ def main():
     p = sub.add_parser('list-bookings')
     p.add_argument('--all', action='store_true')
 
+    p = sub.add_parser('add-rate-plan')
+    p.add_argument('--name', required=True)
+    p.add_argument('--room-type', dest='room_type')
+    p.add_argument('--start', dest='start_date', type=iso_date, help='first night (YYYY-MM-DD)')
+    p.add_argument('--end', dest='end_date', type=iso_date, help='last night (YYYY-MM-DD)')
+    p.add_argument('--rate', type=float, help='nightly rate in UGX')
+    p.add_argument('--weekend-surcharge', type=float, dest='weekend_surcharge', help='percent added on Fri/Sat nights')
+    p.add_argument('--priority', type=int, default=0)
+
+    p = sub.add_parser('add-los-discount')
+    p.add_argument('--min-nights', required=True, type=int, dest='min_nights')
+    p.add_argument('--percent', required=True, type=float)
+    p.add_argument('--room-type', dest='room_type')
+
+    sub.add_parser('list-rate-plans')
+
+    p = sub.add_parser('quote')
+    p.add_argument('--room-id', required=True, type=int)
+    p.add_argument('--start', dest='start_date', type=iso_date, help='arrival date (YYYY-MM-DD), default today')
+    p.add_argument('--nights', required=True, type=int)
+
     args = parser.parse_args()
-    if args.cmd == 'init-db':
+    applog.setup_logging()
+    # bring databases created by older versions up to the current schema
+    # (idempotent) so every command can rely on the new tables
+    if args.cmd:
         init_db()
+    if args.cmd == 'init-db':
         print('Database initialized at', DB_PATH)
     elif args.cmd == 'add-room':
         add_room(args.number, args.type, args.price)
@@ -272,10 +480,24 @@ def main():
         check_in(args.guest_id, args.room_id, args.nights)
     elif args.cmd == 'check-out':
         check_out(args.booking_id)
+    elif args.cmd == 'group-check-in':
+        group_check_in(args.guest_id, args.nights, args.room_ids, args.room_type, args.count, args.name)
+    elif args.cmd == 'group-check-out':
+        group_check_out(args.group_id)
+    elif args.cmd == 'list-groups':
+        list_groups()
     elif args.cmd == 'monthly-report':
         monthly_report(args.year, args.month)
     elif args.cmd == 'list-bookings':
         list_bookings(show_all=args.all)
+    elif args.cmd == 'add-rate-plan':
+        add_rate_plan(args.name, args.room_type, args.start_date, args.end_date, args.rate, args.weekend_surcharge, args.priority)
+    elif args.cmd == 'add-los-discount':
+        add_los_discount(args.min_nights, args.percent, args.room_type)
+    elif args.cmd == 'list-rate-plans':
+        list_rate_plans()
+    elif args.cmd == 'quote':
+        quote(args.room_id, args.start_date, args.nights)
     else:
         parser.print_help()
 
@@ -0,0 +1,181 @@
+"""Rate plans and the stay quote engine.
+
+A room's nightly rate starts at `rooms.price` and is overridden by any
+`rate_plans` rows covering that night (seasonal rates, weekend surcharges,
+per-room-type plans). `los_discounts` then take a percentage off stays of
+at least `min_nights`.
+
+For every (room type, base price, year) a cumulative array of nightly rates
+is built once, so pricing a stay is two lookups per year it touches instead
+of a loop over its nights. The arrays are dropped when the rate tables
+change.
+"""
+from datetime import date, timedelta
+from itertools import accumulate
+import threading
+
+# rates are applied to the nights of Friday and Saturday
+WEEKEND_DAYS = (4, 5)
+RATE_TABLES = ('rate_plans', 'los_discounts')
+# longest stay that can be quoted
+MAX_QUOTE_NIGHTS = 365
+
+_book = None
+_book_lock = threading.Lock()
+
+
+def create_tables(cur):
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS rate_plans (
+        id INTEGER PRIMARY KEY,
+        name TEXT,
+        room_type TEXT,
+        start_date TEXT,
+        end_date TEXT,
+        nightly_rate REAL,
+        weekend_surcharge REAL,
+        priority INTEGER DEFAULT 0
+    )
+    ''')
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS los_discounts (
+        id INTEGER PRIMARY KEY,
+        room_type TEXT,
+        min_nights INTEGER,
+        percent REAL
+    )
+    ''')
+
+
+class RateBook:
+    """Snapshot of the rate tables with lazily built per-year rate arrays."""
+
+    def __init__(self, plans, discounts):
+        # apply low priority first so higher priority plans overwrite them;
+        # at equal priority a room-type plan beats a plan for all types
+        self.plans = sorted(plans, key=lambda p: (p[5], p[0] is not None))
+        self.discounts = sorted(discounts, key=lambda d: d[1], reverse=True)
+        self._calendars = {}
+        self._lock = threading.Lock()
+
+    def _calendar(self, room_type, base_price, year):
+        key = (room_type, base_price, year)
+        cum = self._calendars.get(key)
+        if cum is not None:
+            return cum
+        jan1 = date(year, 1, 1)
+        days = date(year, 12, 31).timetuple().tm_yday
+        rates = [base_price] * days
+        surcharges = [0.0] * days
+        for p_type, p_start, p_end, p_rate, p_surcharge, _ in self.plans:
+            if p_type is not None and p_type != room_type:
+                continue
+            lo = max((date.fromisoformat(p_start) - jan1).days, 0) if p_start else 0
+            hi = min((date.fromisoformat(p_end) - jan1).days + 1, days) if p_end else days
+            if lo >= hi:
+                continue
+            if p_rate is not None:
+                rates[lo:hi] = [p_rate] * (hi - lo)
+            if p_surcharge is not None:
+                surcharges[lo:hi] = [p_surcharge] * (hi - lo)
+        first = jan1.weekday()
+        nightly = [
+            round(r * (1 + s / 100)) if (first + i) % 7 in WEEKEND_DAYS else round(r)
+            for i, (r, s) in enumerate(zip(rates, surcharges))
+        ]
+        cum = [0] + list(accumulate(nightly))
+        with self._lock:
+            self._calendars[key] = cum
+        return cum
+
+    def stay_amount(self, room_type, base_price, start, end):
+        """Undiscounted price in UGX of the nights from `start` up to `end`."""
+        total = 0
+        while start < end:
+            cum = self._calendar(room_type, base_price, start.year)
+            stop = end if end.year == start.year else date(start.year + 1, 1, 1)
+            jan1 = date(start.year, 1, 1)
+            total += cum[(stop - jan1).days] - cum[(start - jan1).days]
+            start = stop
+        return total
+
+    def discount_percent(self, room_type, nights):
+        for d_type, min_nights, percent in self.discounts:
+            if nights >= min_nights and (d_type is None or d_type == room_type):
+                return percent
+        return 0
+
+    def quote(self, room_type, base_price, start, end):
+        """Price the nights from `start` up to `end`, charging at least one."""
+        base_price = int(base_price or 0)
+        if end <= start:
+            end = start + timedelta(days=1)
+        nights = (end - start).days
+        subtotal = self.stay_amount(room_type, base_price, start, end)
+        percent = self.discount_percent(room_type, nights)
+        discount = int(round(subtotal * percent / 100))
+        return {
+            'nights': nights,
+            'subtotal_ugx': subtotal,
+            'discount_percent': percent,
+            'discount_ugx': discount,
+            'total_ugx': subtotal - discount,
+        }
+
+
+def get_rate_book(cur):
+    """Return the current RateBook, reloading it only if the rates changed."""
+    global _book
+    cur.execute('SELECT name, version FROM table_versions WHERE name IN (?, ?) ORDER BY name', RATE_TABLES)
+    versions = tuple((r[0], r[1]) for r in cur.fetchall())
+    book = _book
+    if book is not None and book[0] == versions:
+        return book[1]
+    cur.execute('SELECT room_type, start_date, end_date, nightly_rate, weekend_surcharge, COALESCE(priority, 0) FROM rate_plans')
+    plans = [tuple(r) for r in cur.fetchall()]
+    cur.execute('SELECT room_type, min_nights, percent FROM los_discounts')
+    discounts = [tuple(r) for r in cur.fetchall()]
+    rate_book = RateBook(plans, discounts)
+    with _book_lock:
+        _book = (versions, rate_book)
+    return rate_book
+
+
+def quote_room(cur, room_id, start, nights):
+    """Quote `nights` nights in room `room_id` from `start`, or None if no such room.
+
+    Raises ValueError unless 1 <= nights <= MAX_QUOTE_NIGHTS and the stay
+    ends within the calendar.
+    """
+    nights = int(nights)
+    if not 0 < nights <= MAX_QUOTE_NIGHTS:
+        raise ValueError(f'nights must be between 1 and {MAX_QUOTE_NIGHTS}')
+    try:
+        end = start + timedelta(days=nights)
+    except OverflowError:
+        raise ValueError('start date is too far in the future') from None
+    cur.execute('SELECT number, type, price FROM rooms WHERE id=?', (room_id,))
+    row = cur.fetchone()
+    if not row:
+        return None
+    number, rtype, price = row
+    q = get_rate_book(cur).quote(rtype, price, start, end)
+    q.update({'room_id': room_id, 'room_number': number, 'room_type': rtype,
+              'start_date': start.isoformat(), 'end_date': end.isoformat()})
+    return q
+
+
+def period_revenue(cur, start, end):
+    """Revenue in UGX of bookings starting between `start` and `end`.
+
+    Each booking is priced like its receipt (same quote, at least one
+    night), with its stay cut off at `end`.
+    """
+    book = get_rate_book(cur)
+    cur.execute('SELECT b.start_date, b.end_date, r.type, r.price FROM bookings b JOIN rooms r ON b.room_id=r.id WHERE b.start_date BETWEEN ? AND ?',
+                (start.isoformat(), end.isoformat()))
+    total = 0
+    for start_date, end_date, rtype, price in cur.fetchall():
+        s = date.fromisoformat(start_date)
+        total += book.quote(rtype, price, s, min(date.fromisoformat(end_date), end))['total_ugx']
+    return total
@@ -1,3 +1,3 @@
 @echo off
 cd /d C:\Users\MEDDY\Desktop\TRIALA
-"C:\Users\MEDDY\AppData\Local\Programs\Python\Python313\python.exe" web_app.py >> server.log 2>&1
+"C:\Users\MEDDY\AppData\Local\Programs\Python\Python313\python.exe" web_app.py
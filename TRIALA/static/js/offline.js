@@ -0,0 +1,136 @@
+// Offline front desk: forms marked with data-offline are queued in
+// IndexedDB when the server can't be reached, then sent to /sync in one
+// batch once the connection is back.
+(function(){
+  var DB_NAME = 'triala-offline';
+  var STORE = 'queue';
+
+  if('serviceWorker' in navigator){
+    navigator.serviceWorker.register('/sw.js').catch(function(e){
+      console.warn('Service worker registration failed', e);
+    });
+  }
+  if(!window.indexedDB){
+    return;
+  }
+
+  function openDb(){
+    return new Promise(function(resolve, reject){
+      var req = indexedDB.open(DB_NAME, 1);
+      req.onupgradeneeded = function(){ req.result.createObjectStore(STORE, {keyPath: 'seq', autoIncrement: true}); };
+      req.onsuccess = function(){ resolve(req.result); };
+      req.onerror = function(){ reject(req.error); };
+    });
+  }
+
+  function withStore(mode, fn){
+    return openDb().then(function(db){
+      return new Promise(function(resolve, reject){
+        var tx = db.transaction(STORE, mode);
+        var result = fn(tx.objectStore(STORE));
+        tx.oncomplete = function(){ resolve(result ? result.result : undefined); };
+        tx.onerror = function(){ reject(tx.error); };
+      });
+    });
+  }
+
+  function pending(){
+    return withStore('readonly', function(store){ return store.getAll(); });
+  }
+
+  function today(){
+    // local date, YYYY-MM-DD
+    var d = new Date();
+    return new Date(d.getTime() - d.getTimezoneOffset() * 60000).toISOString().slice(0, 10);
+  }
+
+  function newOpId(){
+    return (window.crypto && crypto.randomUUID) ? crypto.randomUUID() : Date.now() + '-' + Math.random().toString(16).slice(2);
+  }
+
+  function status(text, cat){
+    var el = document.getElementById('offline-status');
+    if(!el){ return; }
+    el.textContent = text;
+    el.className = 'flash ' + (cat || 'info');
+    el.hidden = !text;
+  }
+
+  function showPending(){
+    return pending().then(function(ops){
+      status(ops.length ? ops.length + ' action(s) waiting to sync' + (navigator.onLine ? '' : ' (offline)') : '', 'info');
+    });
+  }
+
+  function enqueue(form){
+    var op = {op_id: newOpId(), type: form.dataset.offline, date: today()};
+    new FormData(form).forEach(function(value, key){ op[key] = value; });
+    if(form.dataset.bookingId){
+      op.booking_id = form.dataset.bookingId;
+    }
+    return withStore('readwrite', function(store){ store.add(op); }).then(showPending);
+  }
+
+  var flushing = false;
+  function flush(){
+    if(flushing || !navigator.onLine){
+      return Promise.resolve();
+    }
+    flushing = true;
+    return pending().then(function(ops){
+      if(!ops.length){
+        return;
+      }
+      return fetch('/sync', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({ops: ops})
+      }).then(function(resp){
+        if(!resp.ok){ throw new Error('sync failed: ' + resp.status); }
+        return resp.json();
+      }).then(function(data){
+        // every op got a result (applied, conflict or error), so drop them all
+        return withStore('readwrite', function(store){
+          ops.forEach(function(op){ store.delete(op.seq); });
+        }).then(function(){
+          var problems = data.results.filter(function(r){ return r.status !== 'applied'; });
+          if(problems.length){
+            status('Synced with problems: ' + problems.map(function(r){ return r.message; }).join('; '), 'danger');
+          } else {
+            status('Synced ' + data.results.length + ' queued action(s)', 'success');
+          }
+        });
+      });
+    }).catch(function(e){
+      console.warn('Offline queue sync failed', e);
+      return showPending();
+    }).then(function(){ flushing = false; });
+  }
+
+  function reachable(){
+    if(!navigator.onLine){
+      return Promise.resolve(false);
+    }
+    return fetch('/ping', {method: 'HEAD', cache: 'no-store'}).then(function(){ return true; }, function(){ return false; });
+  }
+
+  document.addEventListener('submit', function(event){
+    var form = event.target;
+    if(!form.dataset || !form.dataset.offline){
+      return;
+    }
+    event.preventDefault();
+    reachable().then(function(ok){
+      if(ok){
+        // form.submit() doesn't fire this handler again
+        flush().then(function(){ form.submit(); });
+      } else {
+        enqueue(form);
+      }
+    });
+  });
+
+  window.addEventListener('online', flush);
+  window.addEventListener('offline', showPending);
+  document.addEventListener('DOMContentLoaded', function(){ showPending().then(flush); });
+})();
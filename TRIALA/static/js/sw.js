@@ -0,0 +1,49 @@
+// Service worker: keeps a cached shell of the front desk pages so they
+// still open when the server can't be reached.
+var CACHE = 'triala-shell-v1';
+var SHELL = [
+  '/',
+  '/rooms',
+  '/guests',
+  '/bookings',
+  '/static/css/styles.css',
+  '/static/js/offline.js',
+  '/static/images/hero.svg',
+  '/static/images/room1.svg',
+  '/static/images/room2.svg',
+  '/static/images/room3.svg'
+];
+
+self.addEventListener('install', function(event){
+  event.waitUntil(caches.open(CACHE).then(function(cache){ return cache.addAll(SHELL); }));
+  self.skipWaiting();
+});
+
+self.addEventListener('activate', function(event){
+  event.waitUntil(caches.keys().then(function(keys){
+    return Promise.all(keys.filter(function(k){ return k !== CACHE; }).map(function(k){ return caches.delete(k); }));
+  }).then(function(){ return self.clients.claim(); }));
+});
+
+self.addEventListener('fetch', function(event){
+  var req = event.request;
+  var url = new URL(req.url);
+  if(req.method !== 'GET' || url.origin !== location.origin){
+    return;
+  }
+  if(url.pathname.indexOf('/static/') === 0){
+    // static files: cache first
+    event.respondWith(caches.match(req).then(function(hit){ return hit || fetch(req); }));
+    return;
+  }
+  // pages: network first so the desk sees live data, cached copy when offline
+  event.respondWith(fetch(req).then(function(resp){
+    if(resp.ok && SHELL.indexOf(url.pathname) !== -1 && !url.search){
+      var copy = resp.clone();
+      caches.open(CACHE).then(function(cache){ cache.put(req, copy); });
+    }
+    return resp;
+  }).catch(function(){
+    return caches.match(req, {ignoreSearch: true});
+  }));
+});
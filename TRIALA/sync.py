@@ -0,0 +1,124 @@
+"""Batch sync of check-ins and check-outs queued by an offline front desk.
+
+Operations are applied in the order they were queued, in one transaction.
+Each one is checked against the current state first, so an operation that
+no longer makes sense (room taken meanwhile, booking already checked out)
+is reported as a conflict and skipped without affecting the others.
+Results are stored by `op_id`, so a batch resent after a dropped response
+is not applied twice.
+"""
+from datetime import date, datetime, timedelta
+import logging
+import pricing
+
+logger = logging.getLogger('triala.sync')
+
+APPLIED = 'applied'
+CONFLICT = 'conflict'
+ERROR = 'error'
+
+
+def create_tables(cur):
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS sync_ops (
+        op_id TEXT PRIMARY KEY,
+        type TEXT,
+        status TEXT,
+        message TEXT,
+        booking_id INTEGER,
+        applied_at TEXT
+    )
+    ''')
+
+
+def _check_in(cur, op, day):
+    guest_id = int(op['guest_id'])
+    room_id = int(op['room_id'])
+    nights = int(op['nights'])
+    if not 0 < nights <= pricing.MAX_QUOTE_NIGHTS:
+        raise ValueError(f'nights must be between 1 and {pricing.MAX_QUOTE_NIGHTS}')
+    cur.execute('SELECT id FROM guests WHERE id=?', (guest_id,))
+    if not cur.fetchone():
+        return ERROR, 'Guest not found', None
+    cur.execute('SELECT number, available FROM rooms WHERE id=?', (room_id,))
+    row = cur.fetchone()
+    if not row:
+        return ERROR, 'Room not found', None
+    if row[1] == 0:
+        return CONFLICT, f'Room {row[0]} is no longer available', None
+    end = day + timedelta(days=nights)
+    cur.execute('INSERT INTO bookings(guest_id, room_id, start_date, end_date, status) VALUES (?, ?, ?, ?, ?)',
+                (guest_id, room_id, day.isoformat(), end.isoformat(), 'checked_in'))
+    booking_id = cur.lastrowid
+    cur.execute('UPDATE rooms SET available=0 WHERE id=?', (room_id,))
+    return APPLIED, f'Checked into room {row[0]}', booking_id
+
+
+def _check_out(cur, op, day):
+    booking_id = int(op['booking_id'])
+    cur.execute('SELECT b.room_id, r.type, r.price, b.start_date, b.end_date, b.status FROM bookings b JOIN rooms r ON b.room_id=r.id WHERE b.id=?', (booking_id,))
+    row = cur.fetchone()
+    if not row:
+        return ERROR, 'Booking not found', booking_id
+    room_id, room_type, room_price, start_date, end_date, status = row
+    if status == 'checked_out':
+        return CONFLICT, 'Already checked out', booking_id
+    s = date.fromisoformat(start_date)
+    last_day = max(min(date.fromisoformat(end_date), day), s)
+    q = pricing.get_rate_book(cur).quote(room_type, room_price, s, last_day)
+    cur.execute('UPDATE bookings SET status=?, end_date=? WHERE id=?', ('checked_out', last_day.isoformat(), booking_id))
+    cur.execute('UPDATE rooms SET available=1 WHERE id=?', (room_id,))
+    return APPLIED, f"Checked out, UGX {q['total_ugx']:,} due", booking_id
+
+
+HANDLERS = {
+    'check_in': _check_in,
+    'check_out': _check_out,
+}
+
+
+def apply_ops(conn, ops):
+    """Apply queued operations in order and return one result dict per op.
+
+    Each op runs under its own savepoint: one that fails, for whatever
+    reason, is rolled back and reported as an error on its own, so it can't
+    block the rest of the queue.
+    """
+    cur = conn.cursor()
+    cur.execute('BEGIN IMMEDIATE')
+    results = []
+    try:
+        for op in ops:
+            op_id = str(op.get('op_id') or '')
+            op_type = op.get('type')
+            cur.execute('SELECT status, message, booking_id FROM sync_ops WHERE op_id=?', (op_id,))
+            done = cur.fetchone() if op_id else None
+            if done:
+                results.append({'op_id': op_id, 'status': done[0], 'message': done[1], 'booking_id': done[2]})
+                continue
+            cur.execute('SAVEPOINT sync_op')
+            try:
+                handler = HANDLERS.get(op_type) if isinstance(op_type, str) else None
+                if handler is None:
+                    raise ValueError(f'Unknown operation {op_type!r}')
+                # the desk's own date for the action, so a check-in queued
+                # yesterday still starts yesterday
+                day = date.fromisoformat(op['date']) if op.get('date') else date.today()
+                status, message, booking_id = handler(cur, op, day)
+            except (KeyError, TypeError, ValueError, OverflowError) as e:
+                cur.execute('ROLLBACK TO sync_op')
+                status, message, booking_id = ERROR, f'Invalid operation: {e}', None
+            except Exception:
+                logger.exception('sync op failed', extra={'op_id': op_id})
+                cur.execute('ROLLBACK TO sync_op')
+                status, message, booking_id = ERROR, 'Could not apply operation', None
+            cur.execute('RELEASE sync_op')
+            if op_id:
+                cur.execute('INSERT INTO sync_ops(op_id, type, status, message, booking_id, applied_at) VALUES (?, ?, ?, ?, ?, ?)',
+                            (op_id, str(op_type), status, message, booking_id, datetime.now().isoformat(timespec='seconds')))
+            results.append({'op_id': op_id, 'status': status, 'message': message, 'booking_id': booking_id})
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return results
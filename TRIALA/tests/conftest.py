@@ -0,0 +1,37 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# point the app at a throwaway database and log file before it is imported
+_tmp = tempfile.mkdtemp(prefix='triala-tests-')
+os.environ['TRIALA_DB'] = os.path.join(_tmp, 'guesthouse.db')
+os.environ['TRIALA_LOG_FILE'] = os.path.join(_tmp, 'triala.log')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import guest_house  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    """Fresh schema with two guests and rooms 101-104 (two single, two double)."""
+    if os.path.exists(guest_house.DB_PATH):
+        os.remove(guest_house.DB_PATH)
+    guest_house.init_db()
+    conn = guest_house.get_conn()
+    conn.executemany('INSERT INTO guests(name, phone) VALUES (?, ?)', [('Alice', '111'), ('Bob', '222')])
+    conn.executemany('INSERT INTO rooms(number, type, price) VALUES (?, ?, ?)',
+                     [('101', 'single', 25000), ('102', 'single', 25000), ('103', 'double', 35000), ('104', 'double', 35000)])
+    conn.commit()
+    conn.close()
+    return guest_house.DB_PATH
+
+
+@pytest.fixture
+def client(db):
+    import web_app
+    web_app.app.config['TESTING'] = True
+    with web_app._fragment_lock:
+        web_app._fragment_cache.clear()
+    return web_app.app.test_client()
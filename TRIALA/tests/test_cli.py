@@ -0,0 +1,61 @@
+import os
+import sqlite3
+import sys
+
+import guest_house
+
+
+def run_cli(monkeypatch, *args):
+    monkeypatch.setattr(sys, 'argv', ['guest_house.py', *args])
+    guest_house.main()
+
+
+def test_cli_migrates_database_from_older_version(monkeypatch, capsys):
+    # the schema shipped before rate plans, groups and change counters
+    if os.path.exists(guest_house.DB_PATH):
+        os.remove(guest_house.DB_PATH)
+    conn = sqlite3.connect(guest_house.DB_PATH)
+    conn.execute('CREATE TABLE rooms (id INTEGER PRIMARY KEY, number TEXT UNIQUE, type TEXT, price REAL, available INTEGER DEFAULT 1)')
+    conn.execute('CREATE TABLE guests (id INTEGER PRIMARY KEY, name TEXT, phone TEXT, nin_number TEXT)')
+    conn.execute('CREATE TABLE bookings (id INTEGER PRIMARY KEY, guest_id INTEGER, room_id INTEGER, start_date TEXT, end_date TEXT, status TEXT)')
+    conn.execute("INSERT INTO rooms(number, type, price) VALUES ('101', 'single', 25000)")
+    conn.execute("INSERT INTO guests(name, phone) VALUES ('Alice', '111')")
+    conn.commit()
+    conn.close()
+
+    run_cli(monkeypatch, 'check-in', '--guest-id', '1', '--room-id', '1', '--nights', '2')
+    run_cli(monkeypatch, 'check-out', '--booking-id', '1')
+    run_cli(monkeypatch, 'list-groups')
+    out = capsys.readouterr().out
+    assert 'Amount (UGX): UGX 25,000' in out
+    assert 'No groups found.' in out
+
+
+def test_add_rate_plan_rejects_bad_dates(db, monkeypatch, capsys):
+    try:
+        run_cli(monkeypatch, 'add-rate-plan', '--name', 'typo', '--start', '2026-12-1', '--rate', '1')
+    except SystemExit as e:
+        assert e.code == 2
+    else:
+        raise AssertionError('malformed date was accepted')
+    run_cli(monkeypatch, 'add-rate-plan', '--name', 'backwards', '--start', '2026-12-31', '--end', '2026-12-01', '--rate', '1')
+    assert 'End date is before start date' in capsys.readouterr().out
+
+    run_cli(monkeypatch, 'add-rate-plan', '--name', 'dec', '--start', '2026-12-01', '--end', '2026-12-31', '--rate', '40000')
+    run_cli(monkeypatch, 'list-rate-plans')
+    out = capsys.readouterr().out
+    assert 'typo' not in out and 'backwards' not in out
+    run_cli(monkeypatch, 'quote', '--room-id', '1', '--start', '2026-12-01', '--nights', '2')
+    assert 'Total (UGX): UGX 80,000' in capsys.readouterr().out
+
+
+def test_add_los_discount_rejects_bad_values(db, monkeypatch, capsys):
+    run_cli(monkeypatch, 'add-los-discount', '--min-nights', '3', '--percent', '150')
+    assert 'Discount percent must be between 0 and 100' in capsys.readouterr().out
+    run_cli(monkeypatch, 'add-los-discount', '--min-nights', '3', '--percent', '-5')
+    assert 'Discount percent must be between 0 and 100' in capsys.readouterr().out
+    run_cli(monkeypatch, 'add-los-discount', '--min-nights', '0', '--percent', '10')
+    assert 'Minimum nights must be at least 1' in capsys.readouterr().out
+
+    run_cli(monkeypatch, 'quote', '--room-id', '1', '--start', '2026-12-01', '--nights', '3')
+    assert 'Total (UGX): UGX 75,000' in capsys.readouterr().out
@@ -0,0 +1,97 @@
+import sqlite3
+import threading
+
+import groups
+import guest_house
+
+
+def add_rooms(count, rtype='wedding'):
+    conn = guest_house.get_conn()
+    conn.executemany('INSERT INTO rooms(number, type, price) VALUES (?, ?, ?)',
+                     [(f'W{i:02d}', rtype, 30000) for i in range(count)])
+    conn.commit()
+    ids = [r[0] for r in conn.execute('SELECT id FROM rooms WHERE type=? ORDER BY id', (rtype,))]
+    conn.close()
+    return ids
+
+
+def test_competing_group_check_ins_never_double_book(db):
+    room_ids = add_rooms(20)
+    wanted = {}
+    results = {}
+    refused = []
+
+    def worker(i):
+        conn = sqlite3.connect(guest_house.DB_PATH, timeout=30)
+        try:
+            if i % 2:
+                wanted[i] = 3
+                results[i] = groups.check_in_group(conn, 1, 2, room_type='wedding', count=3, name=f'g{i}')
+            else:
+                # overlapping explicit blocks of four rooms
+                ids = [room_ids[(i * 3 + k) % len(room_ids)] for k in range(4)]
+                wanted[i] = ids
+                results[i] = groups.check_in_group(conn, 1, 2, room_ids=ids, name=f'g{i}')
+        except ValueError:
+            refused.append(i)
+        finally:
+            conn.close()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(30)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results and refused
+    assert len(results) + len(refused) == 30
+
+    conn = guest_house.get_conn()
+    doubles = conn.execute("SELECT room_id FROM bookings WHERE status='checked_in' GROUP BY room_id HAVING COUNT(*) > 1").fetchall()
+    assert doubles == []
+    booked = conn.execute("SELECT group_id, room_id FROM bookings WHERE status='checked_in'").fetchall()
+    occupied = {r[0] for r in conn.execute('SELECT id FROM rooms WHERE available=0')}
+    groups_in_db = {r[0] for r in conn.execute('SELECT id FROM booking_groups')}
+    conn.close()
+
+    # every successful group got exactly the rooms it asked for, refused ones got none
+    by_group = {}
+    for group_id, room_id in booked:
+        by_group.setdefault(group_id, set()).add(room_id)
+    assert set(by_group) == groups_in_db == {gid for gid, _ in results.values()}
+    for i, (group_id, rooms) in results.items():
+        assert by_group[group_id] == set(rooms)
+        if isinstance(wanted[i], list):
+            assert set(rooms) == set(wanted[i])
+        else:
+            assert len(rooms) == wanted[i]
+    assert occupied == {room_id for _, room_id in booked}
+
+
+def test_single_check_in_cannot_take_a_group_room(client, capsys):
+    group_id, booked = groups.check_in_group(guest_house.get_conn(), 1, 2, room_type='double', count=2)
+    client.post('/bookings', data={'guest_id': '2', 'room_id': str(booked[0]), 'nights': '1'})
+    guest_house.check_in(2, booked[1], 1)
+    assert 'Room is not available' in capsys.readouterr().out
+
+    conn = guest_house.get_conn()
+    rows = conn.execute('SELECT room_id, group_id FROM bookings ORDER BY room_id').fetchall()
+    conn.close()
+    assert rows == [(booked[0], group_id), (booked[1], group_id)]
+
+
+def test_group_check_in_rejects_bad_nights_and_unknown_guest(client, capsys):
+    for nights in ('-3', '0', '1000000000'):
+        resp = client.post('/groups', data={'guest_id': '1', 'nights': nights, 'room_type': 'double', 'count': '2'},
+                           follow_redirects=True)
+        assert resp.status_code == 200
+        assert 'nights must be between 1 and 365' in resp.get_data(as_text=True)
+
+    guest_house.group_check_in(999, 2, room_type='double', count=2)
+    assert 'Guest not found' in capsys.readouterr().out
+
+    conn = guest_house.get_conn()
+    assert conn.execute('SELECT COUNT(*) FROM bookings').fetchone()[0] == 0
+    assert conn.execute('SELECT COUNT(*) FROM booking_groups').fetchone()[0] == 0
+    assert conn.execute('SELECT COUNT(*) FROM rooms WHERE available=0').fetchone()[0] == 0
+    conn.close()
@@ -0,0 +1,40 @@
+import logging
+import logging.handlers
+
+import applog
+
+
+def test_werkzeug_request_lines_are_not_logged(client):
+    applog.setup_logging()
+    assert not logging.getLogger('werkzeug').isEnabledFor(logging.INFO)
+    assert logging.getLogger('werkzeug').isEnabledFor(logging.WARNING)
+
+
+def test_streamed_response_logged_after_body(client, monkeypatch):
+    import web_app
+    records = []
+    monkeypatch.setattr(web_app, 'log_access', lambda *args: records.append(args))
+
+    resp = client.get('/bookings', headers={'X-Request-ID': 'stream-1'}, buffered=False)
+    assert resp.headers['X-Request-ID'] == 'stream-1'
+    assert records == []
+    resp.get_data()
+    resp.close()
+    assert [(r[0], r[1], r[2], r[5]) for r in records] == [('GET', '/bookings', 200, 'stream-1')]
+
+    client.get('/rooms')
+    assert records[-1][1] == '/rooms'
+
+
+def test_external_rotation_reopens_moved_file(tmp_path):
+    path = tmp_path / 'triala.log'
+    handler = applog._file_handler(str(path), 'external')
+    assert isinstance(handler, logging.handlers.WatchedFileHandler)
+    handler.emit(logging.makeLogRecord({'msg': 'before'}))
+    path.rename(tmp_path / 'triala.log.1')
+    handler.emit(logging.makeLogRecord({'msg': 'after'}))
+    handler.close()
+    assert path.read_text().strip() == 'after'
+    handler = applog._file_handler(str(path), 'size')
+    assert isinstance(handler, logging.handlers.RotatingFileHandler)
+    handler.close()
@@ -0,0 +1,21 @@
+from datetime import date, timedelta
+
+import guest_house
+import pricing
+
+
+def test_report_revenue_matches_receipts(db):
+    today = date.today()
+    conn = guest_house.get_conn()
+    cur = conn.cursor()
+    # checked out on arrival day (charged one night) and a normal two-night stay
+    cur.executemany('INSERT INTO bookings(guest_id, room_id, start_date, end_date, status) VALUES (?, ?, ?, ?, ?)',
+                    [(1, 1, today.isoformat(), today.isoformat(), 'checked_out'),
+                     (2, 3, today.isoformat(), (today + timedelta(days=2)).isoformat(), 'checked_out')])
+    conn.commit()
+    book = pricing.get_rate_book(cur)
+    receipts = (book.quote('single', 25000, today, today)['total_ugx']
+                + book.quote('double', 35000, today, today + timedelta(days=2))['total_ugx'])
+    assert receipts == 25000 + 70000
+    assert pricing.period_revenue(cur, today, today + timedelta(days=30)) == receipts
+    conn.close()
@@ -0,0 +1,76 @@
+import guest_house
+import sync
+
+
+def post_ops(client, ops):
+    resp = client.post('/sync', json={'ops': ops})
+    assert resp.status_code == 200
+    return [(r['op_id'], r['status']) for r in resp.json['results']]
+
+
+def bookings():
+    conn = guest_house.get_conn()
+    rows = conn.execute('SELECT room_id, status FROM bookings ORDER BY id').fetchall()
+    conn.close()
+    return rows
+
+
+def test_sync_reports_conflicts_and_keeps_going(client):
+    ops = [
+        {'op_id': 'a', 'type': 'check_in', 'guest_id': 1, 'room_id': 1, 'nights': 2},
+        {'op_id': 'b', 'type': 'check_in', 'guest_id': 2, 'room_id': 1, 'nights': 1},
+        {'op_id': 'c', 'type': 'check_out', 'booking_id': 1},
+        {'op_id': 'd', 'type': 'check_out', 'booking_id': 1},
+    ]
+    assert post_ops(client, ops) == [('a', 'applied'), ('b', 'conflict'), ('c', 'applied'), ('d', 'conflict')]
+    assert bookings() == [(1, 'checked_out')]
+
+
+def test_sync_isolates_bad_ops(client):
+    ops = [
+        {'op_id': 'huge', 'type': 'check_in', 'guest_id': 1, 'room_id': 1, 'nights': 100000000},
+        {'op_id': 'list', 'type': ['check_in'], 'guest_id': 1, 'room_id': 1, 'nights': 1},
+        {'op_id': 'date', 'type': 'check_in', 'guest_id': 1, 'room_id': 1, 'nights': 1, 'date': 5},
+        {'op_id': 'missing', 'type': 'check_out', 'booking_id': 999},
+        {'op_id': 'ok', 'type': 'check_in', 'guest_id': 1, 'room_id': 2, 'nights': 1},
+    ]
+    assert post_ops(client, ops) == [('huge', 'error'), ('list', 'error'), ('date', 'error'),
+                                     ('missing', 'error'), ('ok', 'applied')]
+    assert bookings() == [(2, 'checked_in')]
+
+
+def test_sync_rolls_back_a_failing_op_alone(client, monkeypatch):
+    def half_check_in(cur, op, day):
+        cur.execute('UPDATE rooms SET available=0 WHERE id=1')
+        raise RuntimeError('disk on fire')
+
+    monkeypatch.setitem(sync.HANDLERS, 'broken', half_check_in)
+    ops = [
+        {'op_id': 'x', 'type': 'broken'},
+        {'op_id': 'y', 'type': 'check_in', 'guest_id': 1, 'room_id': 3, 'nights': 1},
+    ]
+    assert post_ops(client, ops) == [('x', 'error'), ('y', 'applied')]
+    conn = guest_house.get_conn()
+    assert conn.execute('SELECT available FROM rooms WHERE id=1').fetchone()[0] == 1
+    conn.close()
+
+
+def test_sync_replay_by_op_id_is_not_applied_twice(client):
+    ops = [{'op_id': 'once', 'type': 'check_in', 'guest_id': 1, 'room_id': 1, 'nights': 1}]
+    first = client.post('/sync', json={'ops': ops}).json['results']
+    second = client.post('/sync', json={'ops': ops}).json['results']
+    assert first == second
+    assert first[0]['status'] == 'applied'
+    assert bookings() == [(1, 'checked_in')]
+
+
+def test_sync_rejects_malformed_payload(client):
+    assert client.post('/sync', json=[1]).status_code == 400
+    assert client.post('/sync', json={'ops': [1]}).status_code == 400
+
+
+def test_ping_answers_head_and_get(client):
+    for method in (client.head, client.get):
+        resp = method('/ping')
+        assert resp.status_code == 204
+        assert resp.get_data() == b''
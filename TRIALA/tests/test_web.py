@@ -0,0 +1,18 @@
+def test_flash_after_check_in_is_shown_once(client):
+    resp = client.post('/bookings', data={'guest_id': '1', 'room_id': '1', 'nights': '2'})
+    assert resp.status_code == 302
+    assert 'Checked in' in client.get('/bookings').get_data(as_text=True)
+    assert 'Checked in' not in client.get('/rooms').get_data(as_text=True)
+
+
+def test_quote_rejects_out_of_range_nights(client):
+    assert client.get('/quote?room_id=1&nights=3').status_code == 200
+    for nights in ('0', '366', '99999999'):
+        resp = client.get(f'/quote?room_id=1&nights={nights}')
+        assert resp.status_code == 400
+        assert 'nights must be between 1 and 365' in resp.json['error']
+    assert client.get('/quote?room_id=999&nights=1').status_code == 404
+    resp = client.get('/quote?room_id=1&nights=1&start=9999-12-31')
+    assert resp.status_code == 400
+    assert 'too far in the future' in resp.json['error']
+    assert client.get('/quote?room_id=1&nights=1&start=9999-12-30').json['end_date'] == '9999-12-31'
@@ -1,18 +1,147 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
-from flask import send_file
+from flask import Flask, render_template, request, redirect, url_for, flash, get_flashed_messages
+from flask import send_file, send_from_directory, stream_template, jsonify, g
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
+from collections import OrderedDict
 import sqlite3
+import logging
 import os
-from guest_house import DB_PATH
+import threading
+import time
+import uuid
+import applog
+import groups
+import pricing
+import sync
+from guest_house import DB_PATH, init_db
 
 # conversion rate USD -> UGX
 RATE_USD_TO_UGX = 3700
+# compiled templates are kept here so worker boot doesn't recompile them
+TEMPLATE_CACHE_DIR = os.path.join(os.path.dirname(__file__), '.jinja_cache')
+# number of rendered fragments kept in memory per worker
+FRAGMENT_CACHE_SIZE = 64
+# rows fetched per round trip while streaming a listing
+STREAM_BATCH_SIZE = 200
+# requests slower than this are always logged, whatever the sample rate
+SLOW_REQUEST_MS = 1000
+
+applog.setup_logging()
+logger = logging.getLogger('triala.web')
+access_logger = logging.getLogger('triala.access')
 
 app = Flask(__name__)
 app.secret_key = 'dev'
+os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+app.jinja_options = {**app.jinja_options, 'bytecode_cache': FileSystemBytecodeCache(TEMPLATE_CACHE_DIR)}
+
+# make sure the change counters used by the fragment cache exist
+init_db()
+
+_fragment_cache = OrderedDict()
+_fragment_lock = threading.Lock()
+
+
+@app.before_request
+def start_request():
+    rid = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+    g.request_id = rid
+    g.request_started = time.perf_counter()
+    g.request_id_token = applog.request_id.set(rid)
+
+
+def log_access(method, path, status, started, remote_addr, rid):
+    duration_ms = round((time.perf_counter() - started) * 1000, 1)
+    level = logging.INFO
+    if status >= 400 or duration_ms >= SLOW_REQUEST_MS:
+        level = logging.WARNING
+    access_logger.log(level, '%s %s %s', method, path, status,
+                      extra={'method': method, 'path': path, 'status': status, 'duration_ms': duration_ms,
+                             'remote_addr': remote_addr, 'request_id': rid})
+
+
+@app.after_request
+def log_request(resp):
+    args = (request.method, request.path, resp.status_code, g.request_started, request.remote_addr, g.request_id)
+    if resp.is_streamed:
+        # the body is only produced after this hook returns; log once it has
+        # been sent so the duration includes rendering it
+        resp.call_on_close(lambda: log_access(*args))
+    else:
+        log_access(*args)
+    resp.headers['X-Request-ID'] = g.request_id
+    return resp
+
+
+@app.teardown_request
+def end_request(exc):
+    token = g.pop('request_id_token', None)
+    if token is not None:
+        applog.request_id.reset(token)
+
+
+def error_page(code, message):
+    return render_template('error.html', code=code, message=message, request_id=g.get('request_id')), code
+
+
+@app.errorhandler(404)
+def not_found(e):
+    return error_page(404, 'Page not found.')
+
+
+@app.errorhandler(500)
+def server_error(e):
+    # unhandled exceptions are already logged by Flask with their traceback
+    return error_page(500, 'Something went wrong on our side.')
 
 
 def get_conn():
-    return sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def iter_rows(sql, params=()):
+    """Yield rows in batches from a connection opened on first iteration.
+
+    Used with `stream_template` so large listings are rendered while they
+    are read instead of being fetched in full first.
+    """
+    conn = get_conn()
+    try:
+        cur = conn.execute(sql, params)
+        while True:
+            rows = cur.fetchmany(STREAM_BATCH_SIZE)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        conn.close()
+
+
+def table_versions(cur, tables):
+    cur.execute('SELECT name, version FROM table_versions WHERE name IN ({}) ORDER BY name'.format(','.join('?' * len(tables))), tables)
+    return tuple((r[0], r[1]) for r in cur.fetchall())
+
+
+def cached_fragment(cur, name, tables, template, load):
+    """Render `template` with the context returned by `load(cur)`.
+
+    The HTML is reused until one of `tables` changes, so the query and
+    render only happen on the first request after a write.
+    """
+    key = (name, table_versions(cur, tables))
+    with _fragment_lock:
+        html = _fragment_cache.get(key)
+        if html is not None:
+            _fragment_cache.move_to_end(key)
+            return html
+    html = Markup(render_template(template, **load(cur)))
+    with _fragment_lock:
+        _fragment_cache[key] = html
+        while len(_fragment_cache) > FRAGMENT_CACHE_SIZE:
+            _fragment_cache.popitem(last=False)
+    return html
 
 
 @app.route('/')
@@ -20,6 +149,40 @@ def index():
     return render_template('index.html')
 
 
+@app.route('/sw.js')
+def service_worker():
+    # served from the root so the worker's scope covers every page
+    resp = send_from_directory(os.path.join(app.static_folder, 'js'), 'sw.js', mimetype='application/javascript')
+    resp.headers['Cache-Control'] = 'no-cache'
+    return resp
+
+
+@app.route('/ping', methods=['GET', 'HEAD'])
+def ping():
+    # cheap reachability probe for the offline queue
+    return '', 204
+
+
+@app.route('/sync', methods=['POST'])
+def sync_queue():
+    """Apply check-ins/check-outs queued while the desk was offline.
+
+    Expects {"ops": [{"op_id", "type", "date", ...}, ...]} and returns one
+    result per op, in order.
+    """
+    payload = request.get_json(silent=True)
+    ops = payload.get('ops') if isinstance(payload, dict) else None
+    if not isinstance(ops, list) or not all(isinstance(op, dict) for op in ops):
+        return jsonify({'error': 'expected {"ops": [...]}'}), 400
+    conn = get_conn()
+    try:
+        results = sync.apply_ops(conn, ops)
+    finally:
+        conn.close()
+    logger.info('sync batch applied', extra={'ops': len(ops), 'conflicts': sum(r['status'] != sync.APPLIED for r in results)})
+    return jsonify({'results': results})
+
+
 @app.route('/rooms', methods=['GET', 'POST'])
 def rooms():
     conn = get_conn()
@@ -35,17 +198,26 @@ def rooms():
         except Exception as e:
             flash(str(e), 'danger')
         return redirect(url_for('rooms'))
+    rooms_grid = cached_fragment(cur, 'rooms_grid', ('rooms',), '_rooms_grid.html', _load_rooms)
+    conn.close()
+    return render_template('rooms.html', rooms_grid=rooms_grid)
+
+
+def _load_rooms(cur):
     cur.execute('SELECT id, number, type, price, available FROM rooms ORDER BY number')
-    rows = cur.fetchall()
     rooms = []
-    for r in rows:
-        # r: (id, number, type, price, available)
+    for r in cur.fetchall():
         # price is stored in UGX
-        price_ugx = int(r[3] or 0)
-        price_str = f"UGX {price_ugx:,}"
-        rooms.append((r[0], r[1], r[2], price_ugx, r[4], price_str))
-    conn.close()
-    return render_template('rooms.html', rooms=rooms)
+        price_ugx = int(r['price'] or 0)
+        rooms.append({
+            'id': r['id'],
+            'number': r['number'],
+            'type': r['type'],
+            'price': price_ugx,
+            'available': r['available'],
+            'price_str': f"UGX {price_ugx:,}",
+        })
+    return {'rooms': rooms}
 
 
 @app.route('/guests', methods=['GET', 'POST'])
@@ -60,10 +232,14 @@ def guests():
         conn.commit()
         flash('Guest registered', 'success')
         return redirect(url_for('guests'))
-    cur.execute('SELECT id, name, phone, nin_number FROM guests ORDER BY id')
-    guests = cur.fetchall()
+    guests_table = cached_fragment(cur, 'guests_table', ('guests',), '_guests_table.html', _load_guests)
     conn.close()
-    return render_template('guests.html', guests=guests)
+    return render_template('guests.html', guests_table=guests_table)
+
+
+def _load_guests(cur):
+    cur.execute('SELECT id, name, phone, nin_number FROM guests ORDER BY id')
+    return {'guests': cur.fetchall()}
 
 
 @app.route('/bookings', methods=['GET', 'POST'])
@@ -75,9 +251,11 @@ def bookings():
         room_id = int(request.form['room_id'])
         nights = int(request.form['nights'])
         # check availability
-        cur.execute('SELECT available FROM rooms WHERE id=?', (room_id,))
-        row = cur.fetchone()
-        if not row or row[0] == 0:
+        # claim the room and check availability in one statement, so a
+        # concurrent (group) check-in can't take it in between
+        cur.execute('UPDATE rooms SET available=0 WHERE id=? AND available=1', (room_id,))
+        if cur.rowcount != 1:
+            conn.rollback()
             flash('Room not available', 'danger')
             conn.close()
             return redirect(url_for('bookings'))
@@ -86,8 +264,9 @@ def bookings():
         end = start + timedelta(days=nights)
         cur.execute('INSERT INTO bookings(guest_id, room_id, start_date, end_date, status) VALUES (?, ?, ?, ?, ?)',
                     (guest_id, room_id, start.isoformat(), end.isoformat(), 'checked_in'))
-        cur.execute('UPDATE rooms SET available=0 WHERE id=?', (room_id,))
+        booking_id = cur.lastrowid
         conn.commit()
+        logger.info('checked in', extra={'booking_id': booking_id, 'guest_id': guest_id, 'room_id': room_id, 'nights': nights})
         flash('Checked in', 'success')
         conn.close()
         return redirect(url_for('bookings'))
@@ -95,24 +274,157 @@ def bookings():
     # allow optional filtering by guest via query param ?guest_id=
     guest_id = request.args.get('guest_id')
     guest_name = None
+    bookings_sql = "SELECT b.id, g.name AS guest_name, r.number AS room_number, b.start_date, b.end_date, b.status FROM bookings b JOIN guests g ON b.guest_id=g.id JOIN rooms r ON b.room_id=r.id"
+    bookings = iter_rows(bookings_sql + " ORDER BY b.id")
     if guest_id:
         try:
             gid = int(guest_id)
             cur.execute("SELECT name FROM guests WHERE id=?", (gid,))
             row = cur.fetchone()
             guest_name = row[0] if row else None
-            cur.execute("SELECT b.id, g.name, r.number, b.start_date, b.end_date, b.status FROM bookings b JOIN guests g ON b.guest_id=g.id JOIN rooms r ON b.room_id=r.id WHERE b.guest_id=? ORDER BY b.id", (gid,))
+            bookings = iter_rows(bookings_sql + " WHERE b.guest_id=? ORDER BY b.id", (gid,))
         except Exception:
-            cur.execute("SELECT b.id, g.name, r.number, b.start_date, b.end_date, b.status FROM bookings b JOIN guests g ON b.guest_id=g.id JOIN rooms r ON b.room_id=r.id ORDER BY b.id")
-    else:
-        cur.execute("SELECT b.id, g.name, r.number, b.start_date, b.end_date, b.status FROM bookings b JOIN guests g ON b.guest_id=g.id JOIN rooms r ON b.room_id=r.id ORDER BY b.id")
-    bookings = cur.fetchall()
+            pass
+    guest_options = cached_fragment(cur, 'guest_options', ('guests',), '_guest_options.html', _load_guest_options)
+    room_options = cached_fragment(cur, 'room_options', ('rooms',), '_room_options.html', _load_room_options)
+    conn.close()
+    # the bookings table grows without bound, so stream it instead of
+    # building the whole page before the first byte is sent
+    # pop the flashes now: by the time base.html runs inside the stream the
+    # session cookie has been sent and the pop would never be saved
+    flashes = get_flashed_messages(with_categories=True)
+    return stream_template('bookings.html', bookings=bookings, guest_options=guest_options, room_options=room_options, guest_filter=guest_id, guest_name=guest_name, flashes=flashes)
+
+
+def _load_guest_options(cur):
     cur.execute('SELECT id, name FROM guests ORDER BY id')
-    guests = cur.fetchall()
+    return {'guests': cur.fetchall()}
+
+
+def _load_room_options(cur):
     cur.execute('SELECT id, number FROM rooms WHERE available=1 ORDER BY number')
-    rooms = cur.fetchall()
+    return {'rooms': cur.fetchall()}
+
+
+@app.route('/groups', methods=['GET', 'POST'])
+def group_bookings():
+    conn = get_conn()
+    cur = conn.cursor()
+    if request.method == 'POST':
+        guest_id = int(request.form['guest_id'])
+        nights = int(request.form['nights'])
+        room_ids = request.form.getlist('room_ids')
+        count = request.form.get('count', type=int)
+        try:
+            group_id, booked = groups.check_in_group(conn, guest_id, nights, room_ids=room_ids or None,
+                                                     room_type=request.form.get('room_type'), count=count,
+                                                     name=request.form.get('name', '').strip() or None)
+            logger.info('group checked in', extra={'group_id': group_id, 'guest_id': guest_id, 'room_ids': booked})
+            flash(f'Group {group_id} checked into {len(booked)} room(s)', 'success')
+        except ValueError as e:
+            flash(str(e), 'danger')
+        conn.close()
+        return redirect(url_for('group_bookings'))
+    cur.execute("SELECT bg.id, bg.name, g.name AS guest_name, COUNT(b.id) AS rooms, SUM(b.status!='checked_out') AS open_rooms FROM booking_groups bg JOIN guests g ON bg.guest_id=g.id LEFT JOIN bookings b ON b.group_id=bg.id GROUP BY bg.id ORDER BY bg.id")
+    group_rows = cur.fetchall()
+    cur.execute('SELECT type, COUNT(*) FROM rooms WHERE available=1 GROUP BY type ORDER BY type')
+    room_types = cur.fetchall()
+    guest_options = cached_fragment(cur, 'guest_options', ('guests',), '_guest_options.html', _load_guest_options)
+    room_options = cached_fragment(cur, 'room_options', ('rooms',), '_room_options.html', _load_room_options)
+    conn.close()
+    return render_template('groups.html', groups=group_rows, room_types=room_types, guest_options=guest_options, room_options=room_options)
+
+
+@app.route('/groups/<int:group_id>/check-out', methods=['POST'])
+def group_check_out(group_id):
+    conn = get_conn()
+    group = groups.get_group(conn.cursor(), group_id)
+    try:
+        lines = groups.check_out_group(conn, group_id)
+    except ValueError as e:
+        flash(str(e), 'danger' if group is None else 'info')
+        conn.close()
+        return redirect(url_for('group_bookings'))
+    conn.close()
+    total_ugx = sum(line['amount_ugx'] for line in lines)
+    total_usd = (total_ugx / RATE_USD_TO_UGX) if RATE_USD_TO_UGX else 0.0
+    logger.info('group checked out', extra={'group_id': group_id, 'rooms': len(lines), 'amount_ugx': total_ugx})
+    receipt = {
+        'group_id': group_id,
+        'group_name': group[1],
+        'guest_name': group[2],
+        'guest_phone': group[3],
+        'guest_nin': group[4],
+        'lines': lines,
+        'amount_usd': f'${total_usd:.2f}',
+        'amount_ugx': f'UGX {total_ugx:,}'
+    }
+    return render_template('group_receipt.html', receipt=receipt)
+
+
+@app.route('/groups/<int:group_id>/invoice')
+def group_invoice(group_id):
+    conn = get_conn()
+    cur = conn.cursor()
+    group = groups.get_group(cur, group_id)
+    if not group:
+        flash('Group not found', 'danger')
+        conn.close()
+        return redirect(url_for('group_bookings'))
+    lines = groups.invoice_lines(cur, group_id)
     conn.close()
-    return render_template('bookings.html', bookings=bookings, guests=guests, rooms=rooms, guest_filter=guest_id, guest_name=guest_name)
+    _, group_name, guest_name, guest_phone, guest_nin = group
+    total_ugx = sum(line['amount_ugx'] for line in lines)
+    total_usd = (total_ugx / RATE_USD_TO_UGX) if RATE_USD_TO_UGX else 0.0
+
+    # generate PDF invoice
+    try:
+        from io import BytesIO
+        from reportlab.lib.pagesizes import A4
+        from reportlab.pdfgen import canvas
+
+        buf = BytesIO()
+        c = canvas.Canvas(buf, pagesize=A4)
+        width, height = A4
+        c.setFont('Helvetica-Bold', 18)
+        c.drawString(40, height - 60, f'Invoice — Group #{group_id} {group_name or ""}')
+        from datetime import datetime
+        c.setFont('Helvetica', 10)
+        c.drawString(40, height - 80, f'Date: {datetime.now().date().isoformat()}')
+
+        y = height - 120
+        c.setFont('Helvetica-Bold', 12)
+        c.drawString(40, y, 'Guest')
+        c.setFont('Helvetica', 11)
+        c.drawString(40, y - 18, f'Name: {guest_name}')
+        c.drawString(40, y - 36, f'Phone: {guest_phone}')
+        c.drawString(40, y - 54, f'NIN: {guest_nin or ""}')
+
+        y = y - 90
+        c.setFont('Helvetica-Bold', 12)
+        c.drawString(40, y, 'Rooms')
+        y -= 20
+        c.setFont('Helvetica', 11)
+        for line in lines:
+            c.drawString(40, y, f"Room {line['room_number']}: {line['start_date']} to {line['end_date']}, {line['nights']} night(s) — UGX {line['amount_ugx']:,}")
+            y -= 18
+            if y < 100:
+                c.showPage()
+                c.setFont('Helvetica', 11)
+                y = height - 40
+
+        y -= 10
+        c.setFont('Helvetica-Bold', 12)
+        c.drawString(40, y, f'Total (UGX): UGX {total_ugx:,}')
+        c.drawString(40, y - 18, f'Total (USD): ${total_usd:.2f}')
+
+        c.showPage()
+        c.save()
+        buf.seek(0)
+        return send_file(buf, as_attachment=False, download_name=f'invoice_group_{group_id}.pdf', mimetype='application/pdf')
+    except Exception:
+        logger.exception('group invoice failed', extra={'group_id': group_id})
+        return error_page(500, 'Could not generate the invoice.')
 
 
 @app.route('/reports', methods=['GET', 'POST'])
@@ -145,16 +457,7 @@ def reports():
         cur.execute('SELECT g.name, COUNT(b.id) as bookings FROM bookings b JOIN guests g ON b.guest_id=g.id WHERE b.start_date BETWEEN ? AND ? GROUP BY g.id ORDER BY bookings DESC', (start.isoformat(), end.isoformat()))
         guests_breakdown = cur.fetchall()
         # total revenue in UGX for bookings starting in the period (cap end_date to period end)
-        cur.execute(
-            """
-            SELECT SUM((julianday(CASE WHEN b.end_date > ? THEN ? ELSE b.end_date END) - julianday(b.start_date)) * r.price)
-            FROM bookings b JOIN rooms r ON b.room_id=r.id
-            WHERE b.start_date BETWEEN ? AND ?
-            """,
-            (end.isoformat(), end.isoformat(), start.isoformat(), end.isoformat())
-        )
-        total_ugx = cur.fetchone()[0] or 0
-        total_ugx = int(round(total_ugx))
+        total_ugx = pricing.period_revenue(cur, start, end)
         total_usd = (total_ugx / RATE_USD_TO_UGX) if RATE_USD_TO_UGX else 0.0
         conn.close()
 
@@ -201,16 +504,7 @@ def reports_pdf():
         cur.execute('SELECT g.name, COUNT(b.id) as bookings FROM bookings b JOIN guests g ON b.guest_id=g.id WHERE b.start_date BETWEEN ? AND ? GROUP BY g.id ORDER BY bookings DESC', (start.isoformat(), end.isoformat()))
         guests_breakdown = cur.fetchall()
         # compute totals
-        cur.execute(
-            """
-            SELECT SUM((julianday(CASE WHEN b.end_date > ? THEN ? ELSE b.end_date END) - julianday(b.start_date)) * r.price)
-            FROM bookings b JOIN rooms r ON b.room_id=r.id
-            WHERE b.start_date BETWEEN ? AND ?
-            """,
-            (end.isoformat(), end.isoformat(), start.isoformat(), end.isoformat())
-        )
-        total_ugx = cur.fetchone()[0] or 0
-        total_ugx = int(round(total_ugx))
+        total_ugx = pricing.period_revenue(cur, start, end)
         total_usd = (total_ugx / RATE_USD_TO_UGX) if RATE_USD_TO_UGX else 0.0
         conn.close()
 
@@ -246,23 +540,21 @@ def reports_pdf():
         buf.seek(0)
         return send_file(buf, as_attachment=True, download_name=f'report_{year}_{month:02d}.pdf', mimetype='application/pdf')
     except Exception:
-        import traceback
-        tb = traceback.format_exc()
-        # return stack trace to browser for debugging
-        return tb, 500
+        logger.exception('monthly report PDF failed')
+        return error_page(500, 'Could not generate the report PDF.')
 
 
 @app.route('/check-out/<int:booking_id>', methods=['POST'])
 def check_out(booking_id):
     conn = get_conn()
     cur = conn.cursor()
-    cur.execute('SELECT b.id, b.guest_id, g.name, g.phone, g.nin_number, b.room_id, r.number, r.price, b.start_date, b.end_date, b.status FROM bookings b JOIN guests g ON b.guest_id=g.id JOIN rooms r ON b.room_id=r.id WHERE b.id=?', (booking_id,))
+    cur.execute('SELECT b.id, b.guest_id, g.name, g.phone, g.nin_number, b.room_id, r.number, r.price, r.type, b.start_date, b.end_date, b.status FROM bookings b JOIN guests g ON b.guest_id=g.id JOIN rooms r ON b.room_id=r.id WHERE b.id=?', (booking_id,))
     b = cur.fetchone()
     if not b:
         flash('Booking not found', 'danger')
         conn.close()
         return redirect(url_for('bookings'))
-    _, guest_id, guest_name, guest_phone, guest_nin, room_id, room_number, room_price, start_date, end_date, status = b
+    _, guest_id, guest_name, guest_phone, guest_nin, room_id, room_number, room_price, room_type, start_date, end_date, status = b
     if status == 'checked_out':
         flash('Already checked out', 'info')
         conn.close()
@@ -273,11 +565,10 @@ def check_out(booking_id):
     e = date.fromisoformat(end_date)
     today = date.today()
     last_day = min(e, today)
-    nights = (last_day - s).days
-    if nights <= 0:
-        nights = 1
-    # room_price is stored in UGX
-    amount_ugx = nights * int(room_price or 0)
+    # room_price is stored in UGX; rate plans and discounts are applied on top
+    q = pricing.get_rate_book(cur).quote(room_type, room_price, s, last_day)
+    nights = q['nights']
+    amount_ugx = q['total_ugx']
     amount_usd = (amount_ugx / RATE_USD_TO_UGX) if RATE_USD_TO_UGX else 0.0
 
     # update booking and room
@@ -285,6 +576,7 @@ def check_out(booking_id):
     cur.execute('UPDATE rooms SET available=1 WHERE id=?', (room_id,))
     conn.commit()
     conn.close()
+    logger.info('checked out', extra={'booking_id': booking_id, 'nights': nights, 'amount_ugx': amount_ugx})
 
     receipt = {
         'booking_id': booking_id,
@@ -295,32 +587,55 @@ def check_out(booking_id):
         'start_date': s.isoformat(),
         'checkout_date': last_day.isoformat(),
         'nights': nights,
+        'discount': f"{q['discount_percent']:g}% (UGX {q['discount_ugx']:,})" if q['discount_ugx'] else None,
         'amount_usd': f'${amount_usd:.2f}',
         'amount_ugx': f'UGX {amount_ugx:,}'
     }
     return render_template('receipt.html', receipt=receipt)
 
 
+@app.route('/quote')
+def quote():
+    """Price a prospective stay: /quote?room_id=1&nights=3[&start=YYYY-MM-DD]"""
+    from datetime import date
+    try:
+        room_id = int(request.args['room_id'])
+        nights = int(request.args['nights'])
+        start = request.args.get('start')
+        start = date.fromisoformat(start) if start else date.today()
+    except (KeyError, ValueError):
+        return jsonify({'error': 'room_id and nights are required; start must be YYYY-MM-DD'}), 400
+    conn = get_conn()
+    try:
+        q = pricing.quote_room(conn.cursor(), room_id, start, nights)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    finally:
+        conn.close()
+    if not q:
+        return jsonify({'error': 'Room not found'}), 404
+    q['total_usd'] = round(q['total_ugx'] / RATE_USD_TO_UGX, 2) if RATE_USD_TO_UGX else 0.0
+    return jsonify(q)
+
+
 @app.route('/invoice/<int:booking_id>')
 def invoice(booking_id):
     conn = get_conn()
     cur = conn.cursor()
-    cur.execute('SELECT b.id, g.name, g.phone, g.nin_number, b.room_id, r.number, r.price, b.start_date, b.end_date FROM bookings b JOIN guests g ON b.guest_id=g.id JOIN rooms r ON b.room_id=r.id WHERE b.id=?', (booking_id,))
+    cur.execute('SELECT b.id, g.name, g.phone, g.nin_number, b.room_id, r.number, r.price, r.type, b.start_date, b.end_date FROM bookings b JOIN guests g ON b.guest_id=g.id JOIN rooms r ON b.room_id=r.id WHERE b.id=?', (booking_id,))
     b = cur.fetchone()
     if not b:
         flash('Booking not found', 'danger')
         conn.close()
         return redirect(url_for('bookings'))
-    bid, guest_name, guest_phone, guest_nin, room_id, room_number, room_price, start_date, end_date = b
+    bid, guest_name, guest_phone, guest_nin, room_id, room_number, room_price, room_type, start_date, end_date = b
     from datetime import date
     s = date.fromisoformat(start_date)
     e = date.fromisoformat(end_date)
-    nights = (e - s).days
-    if nights <= 0:
-        nights = 1
-    # room_price stored in UGX
-    rate_ugx = int(room_price or 0)
-    amount_ugx = nights * rate_ugx
+    # room_price stored in UGX; rate plans and discounts are applied on top
+    q = pricing.get_rate_book(cur).quote(room_type, room_price, s, e)
+    nights = q['nights']
+    amount_ugx = q['total_ugx']
     amount_usd = (amount_ugx / RATE_USD_TO_UGX) if RATE_USD_TO_UGX else 0.0
 
     # generate PDF invoice
@@ -359,9 +674,11 @@ def invoice(booking_id):
         c.setFont('Helvetica-Bold', 12)
         c.drawString(40, y, 'Charges')
         c.setFont('Helvetica', 11)
-        c.drawString(40, y - 18, f'Rate (per night): UGX {rate_ugx:,}')
-        c.drawString(40, y - 36, f'Subtotal (UGX): UGX {amount_ugx:,}')
-        c.drawString(40, y - 54, f'Total (USD): ${amount_usd:.2f}')
+        c.drawString(40, y - 18, f'Average rate (per night): UGX {q["subtotal_ugx"] // nights:,}')
+        c.drawString(40, y - 36, f'Subtotal (UGX): UGX {q["subtotal_ugx"]:,}')
+        c.drawString(40, y - 54, f'Discount ({q["discount_percent"]:g}%): UGX {q["discount_ugx"]:,}')
+        c.drawString(40, y - 72, f'Total (UGX): UGX {amount_ugx:,}')
+        c.drawString(40, y - 90, f'Total (USD): ${amount_usd:.2f}')
 
         c.showPage()
         c.save()
@@ -369,11 +686,12 @@ def invoice(booking_id):
         conn.close()
         return send_file(buf, as_attachment=False, download_name=f'invoice_{bid}.pdf', mimetype='application/pdf')
     except Exception:
-        import traceback
-        tb = traceback.format_exc()
+        logger.exception('invoice failed', extra={'booking_id': booking_id})
         conn.close()
-        return tb, 500
+        return error_page(500, 'Could not generate the invoice.')
 
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # the debugger shows tracebacks and a console in the browser, so it is
+    # opt-in: set TRIALA_DEBUG=1 for local development only
+    app.run(host='0.0.0.0', port=5000, debug=os.environ.get('TRIALA_DEBUG') == '1')